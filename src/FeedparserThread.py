@@ -1,9 +1,10 @@
-import pytz
-import time
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import collections
-import threading
+import hashlib
 import feedparser
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxhtml
 
 
 Post = collections.namedtuple('Post', [
@@ -15,36 +16,74 @@ Post = collections.namedtuple('Post', [
     'body'
 ])
 
+# Shared by all worker threads so feeds on the same host reuse keep-alive connections
+HTTP = requests.Session()
+HTTP.headers['User-Agent'] = feedparser.USER_AGENT
+HTTP.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+HTTP.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
 
-class FeedparserThread(threading.Thread):
-    """
-    Each one of these threads will get the task of opening one feed
-    and process its entries.
 
-    Given an url, starting time and a global list, this thread will
-    add new posts to the global list, after processing.
+def download_feed(url, state):
+    """
+    Downloads one feed; the network half of processing a feed.
+
+    state is this feed's own dict holding the last response's
+    etag/modified validators, body digest and posts. The validators are
+    sent as a conditional GET. Returns None when the feed is unchanged
+    (the previous posts in state are still valid): on 304 Not Modified,
+    or when a server that ignores validators sends the same body again.
+    Otherwise returns the response's (content, headers, digest), where
+    headers is a plain dict with lowercased keys (as feedparser looks
+    them up) plus the final URL as content-location, so relative links
+    still resolve.
+    Only the HTTP connection pool is shared, so it can run in any
+    worker thread.
 
     """
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('modified'):
+        headers['If-Modified-Since'] = state['modified']
+    r = HTTP.get(url, headers=headers, timeout=30)
+    if r.status_code == 304 and 'posts' in state:
+        return None
+    r.raise_for_status()
+    digest = hashlib.sha1(r.content).hexdigest()
+    if digest == state.get('digest') and 'posts' in state:
+        return None
+    headers = {k.lower(): v for k, v in r.headers.items()}
+    headers['content-location'] = r.url
+    return r.content, headers, digest
+
+
+def parse_posts(content, headers, START, max_items=None):
+    """
+    Parses a downloaded feed; the CPU half of processing a feed.
 
-    def __init__(self, url, START, posts):
-        threading.Thread.__init__(self)
-        self.url = url
-        self.START = START
-        self.posts = posts
-        self.myposts = []
+    Given the raw feed and starting time, returns the sorted list of
+    new posts. Depends only on its (picklable) arguments, so it can run
+    in a worker process, outside the GIL.
 
-    def run(self):
-        feed = feedparser.parse(self.url)
-        try:
-            blog = feed['feed']['title']
-        except KeyError:
-            blog = "---"
-        for entry in feed['entries']:
-            post = process_entry(entry, blog, self.START)
-            if post:
-                self.myposts.append(post)
-        self.myposts.sort()
-        self.posts += self.myposts
+    If max_items is given, only the newest max_items posts (by time,
+    after dropping those before START) are kept, whatever order the
+    feed lists its entries in.
+
+    """
+    feed = feedparser.parse(content, response_headers=headers)
+    try:
+        blog = plain_text(feed['feed']['title'], feed['feed'].get('title_detail'))
+    except KeyError:
+        blog = "---"
+    posts = []
+    for entry in feed['entries']:
+        post = process_entry(entry, blog, START)
+        if post:
+            posts.append(post)
+    posts.sort()
+    if max_items is not None:
+        posts = posts[-max_items:] if max_items > 0 else []
+    return posts
 
 
 def process_entry(entry, blog, START):
@@ -63,7 +102,8 @@ def process_entry(entry, blog, START):
             return  # Ignore undateable posts
 
     if when:
-        when = pytz.utc.localize(datetime.fromtimestamp(time.mktime(when)))
+        # feedparser has already normalised the date to a UTC struct_time
+        when = datetime(*when[:6], tzinfo=timezone.utc)
     else:
         # print blog, entry
         return
@@ -71,7 +111,7 @@ def process_entry(entry, blog, START):
     if when < START:
         return
 
-    title = entry.get('title', "Null")
+    title = plain_text(entry.get('title', "Null"), entry.get('title_detail'))
 
     try:
         author = entry['author']
@@ -80,6 +120,7 @@ def process_entry(entry, blog, START):
             author = ', '.join(a['name'] for a in entry.get('authors', []))
         except KeyError:
             author = 'Anonymous'
+    author = plain_text(author)
 
     link = entry['link']
 
@@ -89,3 +130,23 @@ def process_entry(entry, blog, START):
         body = entry['summary']
 
     return Post(when, blog, title, author, link, body)
+
+
+def plain_text(value, detail=None):
+    """
+    Returns a feed text field as plain text, to be escaped once on output.
+
+    feedparser hands back HTML-typed fields (per their *_detail type)
+    as markup, e.g. 'Tom &amp; Jerry' or '<i>Dune</i> review'; those
+    lose their tags and entities here. Fields without a detail (author
+    names) are treated as HTML only if they contain '<' or '&'.
+    """
+    if not value:
+        return value
+    if detail is not None:
+        is_html = detail.get('type') in ('text/html', 'application/xhtml+xml')
+    else:
+        is_html = '<' in value or '&' in value
+    if not is_html:
+        return value
+    return lxhtml.fragment_fromstring(value, create_parent='div').text_content()
@@ -6,28 +6,36 @@
 
 from email.utils import COMMASPACE, formatdate, formataddr
 from email.header import Header
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from email.message import EmailMessage
 import smtplib
-import pypandoc
-import pytz
+import mmap
 import time
 import logging
 import subprocess
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
 from datetime import datetime, timedelta, date
+from zoneinfo import ZoneInfo
 import os
 import re
 import tempfile
 import html
 import json
+import io
+import hashlib
 from pathlib import Path
 from shutil import which
-import requests
+from html.parser import HTMLParser
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from openai import OpenAI
 from icalendar import Calendar
-from dateutil.tz import gettz
-from FeedparserThread import FeedparserThread
+from lxml import html as lxhtml
+from ebooklib import epub
+from FeedparserThread import Post, download_feed, parse_posts
 
 logging.basicConfig(level=logging.INFO)
 
@@ -38,30 +46,48 @@ EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWD = os.getenv("EMAIL_PASSWORD")
 EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER)
 KINDLE_EMAIL = os.getenv("KINDLE_EMAIL")
-PANDOC = os.getenv("PANDOC_PATH", "/usr/bin/pandoc")
+USE_CALIBRE = os.getenv("USE_CALIBRE", "").lower() in ("1", "true", "yes")  # build EPUB with ebook-convert
 PERIOD = int(os.getenv("UPDATE_PERIOD", 12))  # minutes between runs (12 => 12 minutes). Adjust if you intend hours.
+FEED_WORKERS = int(os.getenv("FEED_WORKERS", 8))  # upper bound on concurrent feed downloads
+PARSE_WORKERS = os.cpu_count() or 1  # upper bound on feed-parsing processes
+MAX_ITEMS_PER_FEED = int(os.getenv("MAX_ITEMS_PER_FEED", 0)) or None  # optional cap on new posts kept per feed
+MISFIRE_GRACE = 60  # seconds a round may overrun before the missed slot is skipped
+CALENDAR_WORKERS = 8  # upper bound on concurrent calendar downloads
 
 DOC_TITLE = os.getenv("DOC_TITLE", "Daily News")
 DOC_AUTHOR = os.getenv("DOC_AUTHOR", "News2Kindle")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_CLIENT = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None  # reused across rounds
 
 # Paths
 CONFIG_PATH = Path("/app/config")
 FEED_FILE = CONFIG_PATH / "feeds.txt"
 CAL_FILE = CONFIG_PATH / "calendars.txt"  # list of secret iCal URLs, one per line
+HTTP_CACHE = Path(tempfile.gettempdir()) / "n2k-cache"
+FEED_STATE_FILE = CONFIG_PATH / ".etags.json"  # per-feed validators, body digest and last posts
+LAST_SENT_FILE = CONFIG_PATH / ".last_sent"  # date and content hash of the last EPUB sent
+SUMMARY_CACHE_DIR = Path(tempfile.gettempdir())  # n2k-gpt-<date>-<hash>.html
+
+# HTTP cache lifetimes (seconds)
+WEATHER_TTL = 60 * 60
+CALENDAR_TTL = 15 * 60
+STALE_IF_ERROR = 24 * 60 * 60  # serve the last good response this long when a refresh fails
+
+# Shared keep-alive session; weather and calendar responses are reused until they expire,
+# then revalidated with If-None-Match/If-Modified-Since where the server sent validators
+HTTP = requests_cache.CachedSession(str(HTTP_CACHE), expire_after=WEATHER_TTL, stale_if_error=STALE_IF_ERROR)
+HTTP_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.3))
+HTTP.mount("https://", HTTP_ADAPTER)
+HTTP.mount("http://", HTTP_ADAPTER)  # some calendar providers still publish plain-http ICS links
 
 # Timezone
-LONDON_TZ = gettz("Europe/London")
+UTC = ZoneInfo("UTC")
+LONDON_TZ = ZoneInfo("Europe/London")
 
 # HTML templates
-HTML_HEAD_TEMPLATE = u"""<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8"/>
-  <title>{DOC_TITLE}</title>
-  <style>
+HTML_CSS = u"""
     body { font-family: serif; line-height: 1.4; }
     h1,h2,h3 { margin-top: 1.2em; }
     .k-card { padding: 0.6em 0.8em; border: 1px solid #ddd; border-radius: 4px; }
@@ -70,29 +96,29 @@ HTML_HEAD_TEMPLATE = u"""<!doctype html>
     ol.headlines li { margin: 0.4em 0; }
     /* Article layout */
     article { margin: 1em 0; }
-  </style>
+"""
+
+# The CSS braces live in HTML_CSS, so the head can be a plain f-string
+HTML_HEAD = f"""<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8"/>
+  <title>{html.escape(DOC_TITLE)}</title>
+  <style>{HTML_CSS}  </style>
 </head>
 <body>
 """
-HTML_HEAD = HTML_HEAD_TEMPLATE.replace("{DOC_TITLE}", html.escape(DOC_TITLE))
 
 HTML_TAIL = u"""
 </body>
 </html>
 """
 
-HTML_PER_POST = u"""
-<article id="post-{idx}">
-  <h2><a href="{link}">{title}</a></h2>
-  <p class="muted"><small>By {author} for <i>{blog}</i>, on {nicedate} at {nicetime}.</small></p>
-  {body}
-</article>
-"""
+# Elements dropped (with their content) from feed fragments
+BAD_TAGS = frozenset({"script", "style", "iframe", "svg", "object", "embed", "noscript", "video", "audio", "img"})
 
-# Sanitisation regexes for feed fragments only
-BAD_TAGS_RE = re.compile(r"</?(script|style|iframe|svg|object|embed|noscript|video|audio)[^>]*>", re.IGNORECASE)
-IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
-TAG_RE = re.compile(r"<[^>]+>")
+# Reduces a full HTML document to the contents of its <body>
+BODY_RE = re.compile(r"(?is).*<body[^>]*>(.*)</body>.*")
 
 # Weather (Open-Meteo)
 LAT, LON = 51.4816, -3.1791
@@ -134,6 +160,9 @@ WEATHERCODE = {
     99: "Thunderstorm with heavy hail",
 }
 
+# Same table indexed by code (WMO codes are 0–99), for lookups without hashing
+WEATHER_DESCRIPTIONS = tuple(WEATHERCODE.get(c, "Weather") for c in range(100))
+
 
 # ----------------------------
 # Feeds
@@ -143,74 +172,135 @@ def load_feeds():
     if not FEED_FILE.exists():
         return []
     with open(FEED_FILE, "r", encoding="utf-8") as f:
-        return [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+        return [url for url in (ln.strip() for ln in f) if url and not url.startswith("#")]
 
 
 def update_start(now):
-    new_now = time.mktime(now.timetuple())
-    FEED_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(FEED_FILE, "a", encoding="utf-8"):
+    new_now = now.timestamp()
+    try:
+        os.utime(FEED_FILE, (new_now, new_now))
+    except FileNotFoundError:
+        FEED_FILE.parent.mkdir(parents=True, exist_ok=True)
+        FEED_FILE.touch()
         os.utime(FEED_FILE, (new_now, new_now))
 
 
 def get_start(fname: Path):
     if not fname.exists():
         # default to 24h ago if no file yet
-        return pytz.utc.localize(datetime.utcnow() - timedelta(hours=24))
-    return pytz.utc.localize(
-        datetime.fromtimestamp(os.path.getmtime(fname)) - timedelta(hours=24)
-    )
+        return datetime.now(UTC) - timedelta(hours=24)
+    return datetime.fromtimestamp(os.path.getmtime(fname), UTC) - timedelta(hours=24)
+
+
+def load_feed_state():
+    try:
+        with open(FEED_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        for st in state.values():
+            st["posts"] = [Post(**dict(p, time=datetime.fromisoformat(p["time"]))) for p in st.get("posts", [])]
+            if "start" in st:
+                st["start"] = datetime.fromisoformat(st["start"])
+        return state
+    except Exception:
+        return {}
+
+
+def save_feed_state(state):
+    out = {
+        url: dict(st, posts=[dict(p._asdict(), time=p.time.isoformat()) for p in st.get("posts", [])],
+                  start=st["start"].isoformat())
+        for url, st in state.items() if st
+    }
+    try:
+        with open(FEED_STATE_FILE, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False)
+    except OSError:
+        pass
 
 
 def get_posts_list(feed_list, start_dt):
+    if not feed_list:
+        return []
+    old_state = load_feed_state()
+    # Per-feed state; feeds no longer listed are dropped
+    state = {url: old_state.get(url, {}) for url in feed_list}
+    # Cached posts only go back to the start date they were parsed with.
+    # If it has moved earlier (feeds.txt mtime set back), fetch those feeds in full.
+    for url, st in state.items():
+        if "start" not in st or st["start"] > start_dt:
+            state[url] = {}
     posts = []
-    ths = []
-    for url in feed_list:
-        th = FeedparserThread(url, start_dt, posts)
-        ths.append(th)
-        th.start()
-    for th in ths:
-        th.join()
+    downloads = {}
+    with ThreadPoolExecutor(max_workers=min(len(feed_list), FEED_WORKERS)) as ex:
+        jobs = {ex.submit(download_feed, url, state[url]): url for url in feed_list}
+        for job in as_completed(jobs):
+            try:
+                downloads[jobs[job]] = job.result()
+            except Exception:
+                logging.exception("Failed to download feed %s", jobs[job])
+
+    # Unchanged feeds (304 or identical body) reuse their previous posts
+    for url, download in downloads.items():
+        if download is None:
+            posts.extend(p for p in state[url]["posts"] if p.time >= start_dt)
+    changed = {url: download for url, download in downloads.items() if download is not None}
+
+    # Parse the rest in worker processes: feedparser is CPU-bound under the GIL.
+    # forkserver, since forking a process that has live threads is unsafe.
+    if changed:
+        with ProcessPoolExecutor(max_workers=min(len(changed), PARSE_WORKERS),
+                                 mp_context=multiprocessing.get_context("forkserver")) as px:
+            jobs = {
+                px.submit(parse_posts, content, headers, start_dt, MAX_ITEMS_PER_FEED): url
+                for url, (content, headers, digest) in changed.items()
+            }
+            for job in as_completed(jobs):
+                url = jobs[job]
+                try:
+                    feed_posts = job.result()
+                except Exception:
+                    logging.exception("Failed to process feed %s", url)
+                    continue
+                posts.extend(feed_posts)
+                _, headers, digest = changed[url]
+                state[url] = {"etag": headers.get("etag"), "modified": headers.get("last-modified"),
+                              "digest": digest, "posts": feed_posts, "start": start_dt}
+    save_feed_state(state)
     return posts
 
 
 def nicedate(dt):
-    return dt.strftime("%d %B %Y").strip("0")
+    # e.g. "1 October 2020"; strip("0") also cut the year's trailing zero ("1 October 202")
+    return f"{dt.day} {dt.strftime('%B')} {dt.year}"
 
 
 def nicehour(dt):
-    return dt.strftime("%I:%M %p").strip("0").lower()
+    # e.g. "9:05 am", "10:30 pm"
+    return f"{dt.hour % 12 or 12}:{dt.minute:02d} {'am' if dt.hour < 12 else 'pm'}"
 
 
 def sanitise_fragment(html_text: str) -> str:
     """Clean feed content fragments; safe to inject inside <body>. Do not use on full document."""
     html_text = html_text.replace("&thinsp;", " ")
-    html_text = BAD_TAGS_RE.sub("", html_text)
-    html_text = IMG_TAG_RE.sub("", html_text)
-    return html_text
-
-
-def nicepost(post, idx):
-    d = post._asdict()
-    d["nicedate"] = nicedate(d["time"])
-    d["nicetime"] = nicehour(d["time"])
-    d["idx"] = idx
-    d["title"] = d.get("title") or "Untitled"
-    d["author"] = d.get("author") or "Unknown"
-    d["blog"] = d.get("blog") or "Source"
-    d["body"] = sanitise_fragment(d.get("body") or "")
-    return d
-
-
-def html_to_text_one_sentence(html_text: str, max_chars: int = 220) -> str:
-    t = TAG_RE.sub(" ", html_text)
-    t = html.unescape(t)
-    t = re.sub(r"\s+", " ", t).strip()
-    m = re.search(r"(.+?[\.!?])(\s|$)", t)
-    s = m.group(1) if m else t
-    if len(s) > max_chars:
-        s = s[: max_chars - 1].rstrip() + "…"
-    return s
+    if "<" not in html_text:
+        return html_text  # plain-text summary: nothing to drop
+    tree = lxhtml.fragment_fromstring(html_text, create_parent="div")
+    for el in [el for el in tree.iter() if el.tag in BAD_TAGS]:
+        el.drop_tree()
+    # Serialise without the wrapping <div>…</div>
+    return lxhtml.tostring(tree, encoding="unicode")[5:-6]
+
+
+def render_post(post, idx):
+    """One <article> per post. An f-string, so the template is parsed at compile time, not per call."""
+    esc = html.escape
+    return f"""
+<article id="post-{idx}">
+  <h2><a href="{esc(post.link)}">{esc(post.title or "Untitled")}</a></h2>
+  <p class="muted"><small>By {esc(post.author or "Unknown")} for <i>{esc(post.blog or "Source")}</i>, on {nicedate(post.time)} at {nicehour(post.time)}.</small></p>
+  {sanitise_fragment(post.body or "")}
+</article>
+"""
 
 
 # ----------------------------
@@ -228,28 +318,39 @@ def _to_dt_local(v):
     if hasattr(v, "hour"):
         dt = v
         if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=pytz.UTC)
+            dt = dt.replace(tzinfo=UTC)
         return dt.astimezone(LONDON_TZ)
     return datetime(v.year, v.month, v.day, 0, 0, tzinfo=LONDON_TZ)
 
 
-def _is_today_local(dt):
-    return dt.date() == datetime.now(LONDON_TZ).date()
+def _fetch_calendar(url):
+    try:
+        r = HTTP.get(url, timeout=15, expire_after=CALENDAR_TTL)
+        r.raise_for_status()
+        return r.content
+    except Exception:
+        return None
 
 
 def fetch_todays_events_struct():
     urls = load_calendar_urls()
+    today = datetime.now(LONDON_TZ).date()
     events = []
-    for url in urls:
+    # Download concurrently, parse serially
+    bodies = []
+    if urls:
+        with ThreadPoolExecutor(max_workers=min(len(urls), CALENDAR_WORKERS)) as ex:
+            bodies = list(ex.map(_fetch_calendar, urls))
+    for content in bodies:
+        if content is None:
+            continue
         try:
-            r = requests.get(url, timeout=15)
-            r.raise_for_status()
-            cal = Calendar.from_ical(r.content)
+            cal = Calendar.from_ical(content)
             for comp in cal.walk("VEVENT"):
                 start = comp.decoded("DTSTART")
                 end = comp.decoded("DTEND", None)
                 dt_start = _to_dt_local(start)
-                if not _is_today_local(dt_start):
+                if dt_start.date() != today:
                     continue
                 dt_end = _to_dt_local(end) if end is not None else None
                 title = str(comp.get("SUMMARY", "Untitled"))
@@ -282,7 +383,7 @@ def fetch_todays_events_struct():
 def fetch_cardiff_weather_data():
     url = OPEN_METEO.format(lat=LAT, lon=LON)
     try:
-        r = requests.get(url, timeout=10)
+        r = HTTP.get(url, timeout=10, expire_after=WEATHER_TTL)
         r.raise_for_status()
         data = r.json()
         d = data["daily"]
@@ -290,7 +391,7 @@ def fetch_cardiff_weather_data():
         idx = d["time"].index(today_str)
         code = int(d["weathercode"][idx])
         return {
-            "description": WEATHERCODE.get(code, "Weather"),
+            "description": WEATHER_DESCRIPTIONS[code] if 0 <= code < len(WEATHER_DESCRIPTIONS) else "Weather",
             "code": code,
             "tmax_c": round(d["temperature_2m_max"][idx]),
             "tmin_c": round(d["temperature_2m_min"][idx]),
@@ -311,7 +412,7 @@ def build_chatgpt_summary_html(weather, events):
     Conversational two-paragraph summary fragment (no headings/lists).
     Kindle-safe: only <p> tags.
     """
-    if not OPENAI_API_KEY:
+    if OPENAI_CLIENT is None:
         # Minimal fallback
         parts = []
         if weather:
@@ -329,8 +430,6 @@ def build_chatgpt_summary_html(weather, events):
         # Headlines: uncertainty placeholder
         return "<p>" + " ".join(parts) + "</p><p>Top stories: Uncertain · BBC/Guardian/The Times; Uncertain · BBC/Guardian/The Times; Uncertain · BBC/Guardian/The Times.</p>"
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
     payload = {
         "date_local": datetime.now(LONDON_TZ).strftime("%A %d %B %Y"),
         "location": "Cardiff, UK",
@@ -338,6 +437,11 @@ def build_chatgpt_summary_html(weather, events):
         "agenda": events[:6],  # keep short
     }
 
+    # Reuse today's summary while weather and agenda are unchanged
+    cache_file = summary_cache_path(payload)
+    if cache_file.exists():
+        return cache_file.read_text(encoding="utf-8")
+
     system_msg = (
         "You are a concise British daily-brief writer. "
         "Return exactly TWO HTML <p> paragraphs, no other tags. "
@@ -350,7 +454,7 @@ def build_chatgpt_summary_html(weather, events):
 
     user_msg = f"DATA (JSON): {json.dumps(payload, ensure_ascii=False)}"
 
-    resp = client.chat.completions.create(
+    resp = OPENAI_CLIENT.chat.completions.create(
         model=OPENAI_MODEL,
         messages=[{"role": "system", "content": system_msg},
                   {"role": "user", "content": user_msg}],
@@ -364,133 +468,209 @@ def build_chatgpt_summary_html(weather, events):
     logging.info("GPT response: %s", frag)
     # Guard: if model returned extra tags, strip to inner <p>…</p>
     if "<html" in frag.lower() or "<body" in frag.lower():
-        frag = re.sub(r"(?is).*<body[^>]*>(.*)</body>.*", r"\1", frag)
+        frag = BODY_RE.sub(r"\1", frag)
     # Ensure only <p> tags remain
-    frag = re.sub(r"(?is)\s*(?!<p>)(?!</p>)[^<]+", lambda m: html.escape(m.group(0)), frag)
+    frag = ParagraphFilter.clean(frag)
+    sweep_summary_cache()
+    # Never cache a blank summary: it would stick for the rest of the day
+    if frag.strip():
+        try:
+            cache_file.write_text(frag, encoding="utf-8")
+        except OSError:
+            pass
     return frag
 
 
+def summary_cache_path(payload) -> Path:
+    today = datetime.now(LONDON_TZ).strftime("%Y-%m-%d")
+    key = hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return SUMMARY_CACHE_DIR / f"n2k-gpt-{today}-{key}.html"
+
+
+def sweep_summary_cache():
+    """Delete cached summaries from previous days."""
+    today = datetime.now(LONDON_TZ).strftime("%Y-%m-%d")
+    for p in SUMMARY_CACHE_DIR.glob("n2k-gpt-*.html"):
+        if not p.name.startswith(f"n2k-gpt-{today}-"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+
+
+
+class ParagraphFilter(HTMLParser):
+    """Single-pass filter keeping only <p>/</p> tags; all text is escaped."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = io.StringIO()
+        self.skip = 0  # inside <script>/<style>
+
+    @classmethod
+    def clean(cls, frag: str) -> str:
+        parser = cls()
+        parser.feed(frag)
+        parser.close()
+        return parser.out.getvalue()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "p":
+            self.out.write("<p>")
+        elif tag in ("script", "style"):
+            self.skip += 1
+
+    def handle_endtag(self, tag):
+        if tag == "p":
+            self.out.write("</p>")
+        elif tag in ("script", "style") and self.skip:
+            self.skip -= 1
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.out.write(html.escape(data, quote=False))
 
 
 # ----------------------------
 # EPUB build and email
 # ----------------------------
 
-def build_epub_kindlesafe(html_text: str, out_path: Path) -> Path:
-    # Prefer calibre's ebook-convert to produce EPUB2
-    if which("ebook-convert"):
-        with tempfile.NamedTemporaryFile("w", suffix=".html", delete=False, encoding="utf-8") as tmp_html:
-            tmp_html.write(html_text)
-            tmp_html_path = tmp_html.name
-        cmd = [
-            "ebook-convert",
-            tmp_html_path,
-            str(out_path),
-            "--input-encoding", "utf-8",
-            "--epub-version", "2",
-            "--no-default-epub-cover",
-            "--title", DOC_TITLE,
-            "--authors", DOC_AUTHOR,
-        ]
-        try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            if which("ebook-meta"):
-                subprocess.run(
-                    ["ebook-meta", str(out_path), "--title", DOC_TITLE, "--authors", DOC_AUTHOR],
-                    check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                )
-            return out_path
-        finally:
-            try:
-                os.remove(tmp_html_path)
-            except OSError:
-                pass
+def build_epub_calibre(html_path: Path, out_path: Path) -> Path:
+    # Calibre's ebook-convert forks a full calibre runtime per call, so it is opt-in
+    cmd = [
+        "ebook-convert",
+        str(html_path),
+        str(out_path),
+        "--input-encoding", "utf-8",
+        "--epub-version", "2",
+        "--no-default-epub-cover",
+        "--title", DOC_TITLE,
+        "--authors", DOC_AUTHOR,
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if which("ebook-meta"):
+        subprocess.run(
+            ["ebook-meta", str(out_path), "--title", DOC_TITLE, "--authors", DOC_AUTHOR],
+            check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    return out_path
 
-    # Fallback to pandoc minimal if calibre missing
-    os.environ["PYPANDOC_PANDOC"] = PANDOC
-    pypandoc.convert_text(
-        html_text,
-        to="epub",
-        format="html",
-        outputfile=str(out_path),
-        extra_args=[
-            "--standalone",
-            "--toc",
-            f"--metadata=title:{DOC_TITLE}",
-            f"--metadata=author:{DOC_AUTHOR}",
-            "--metadata=language:en-GB",
-        ],
-    )
+
+def build_epub_kindlesafe(summary_html, posts, articles, out_path: Path) -> Path:
+    # Default: assemble the EPUB in-process from the rendered pieces, no HTML file needed
+    book = epub.EpubBook()
+    book.set_identifier(out_path.stem)
+    book.set_title(DOC_TITLE)
+    book.set_language("en-GB")
+    book.add_author(DOC_AUTHOR)
+    css = epub.EpubItem(uid="style", file_name="style.css", media_type="text/css", content=HTML_CSS)
+    book.add_item(css)
+
+    def chapter(title, file_name, content):
+        item = epub.EpubHtml(title=title, file_name=file_name, lang="en-GB", content=content)
+        item.add_item(css)
+        book.add_item(item)
+        return item
+
+    # One chapter for the summary, then one per rendered post
+    summary = chapter(DOC_TITLE, "summary.xhtml", summary_html.strip() or "<p></p>")
+    chapters = []
+    for i, (post, article) in enumerate(zip(posts, articles), start=1):
+        if i == 1:
+            # The "Articles" heading opens the first article rather than a blank page of its own
+            article = "<h1>Articles</h1>\n" + article
+        chapters.append(chapter(post.title or "Untitled", f"article-{i:03d}.xhtml", article))
+    book.toc = [summary]
+    if chapters:
+        book.toc.append((epub.Section("Articles", chapters[0].file_name), chapters))
+    book.spine = ["nav", summary] + chapters
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(str(out_path), book)
     return out_path
 
 
-def send_mail(send_from, send_to, subject, text, files):
-    msg = MIMEMultipart()
+def build_message(send_from, send_to, subject, text, files):
+    msg = EmailMessage()
     msg["From"] = formataddr((str(Header("", "utf-8")), send_from))
     msg["To"] = COMMASPACE.join(send_to)
     msg["Date"] = formatdate(localtime=True)
     msg["Subject"] = subject
-    msg.attach(MIMEText(text, "plain", "utf-8"))
+    msg.set_content(text)
 
     for f in files or []:
         fpath = Path(f)
-        with open(fpath, "rb") as fil:
-            data = fil.read()
-        if fpath.suffix.lower() == ".epub":
-            part = MIMEApplication(data, _subtype="epub+zip", Name=fpath.name)
-        else:
-            part = MIMEApplication(data, Name=fpath.name)
-        part.add_header("Content-Disposition", f'attachment; filename="{fpath.name}"')
-        msg.attach(part)
+        subtype = "epub+zip" if fpath.suffix.lower() == ".epub" else "octet-stream"
+        if not fpath.stat().st_size:
+            msg.add_attachment(b"", maintype="application", subtype=subtype, filename=fpath.name)
+            continue
+        # Encode straight from the page cache; the raw file never becomes a bytes object
+        with open(fpath, "rb") as fil, mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as data:
+            msg.add_attachment(data, maintype="application", subtype=subtype, filename=fpath.name)
+    return msg
 
-    smtp = smtplib.SMTP(EMAIL_SMTP, EMAIL_SMTP_PORT)
-    smtp.ehlo()
-    smtp.starttls()
-    smtp.ehlo()
-    smtp.login(EMAIL_USER, EMAIL_PASSWD)
-    smtp.sendmail(send_from, send_to, msg.as_string())
-    smtp.quit()
+
+def send_mail(send_from, send_to, subject, text, files):
+    # Port 465 is implicit TLS: no plaintext EHLO + STARTTLS round-trips
+    if EMAIL_SMTP_PORT == 465:
+        smtp = smtplib.SMTP_SSL(EMAIL_SMTP, EMAIL_SMTP_PORT)
+    else:
+        smtp = smtplib.SMTP(EMAIL_SMTP, EMAIL_SMTP_PORT)
+    # The context manager QUITs (or closes) the connection even if sending fails
+    with smtp:
+        smtp.ehlo()
+        if EMAIL_SMTP_PORT != 465:
+            smtp.starttls()
+            smtp.ehlo()
+        smtp.login(EMAIL_USER, EMAIL_PASSWD)
+        msg = build_message(send_from, send_to, subject, text, files)
+        # send_message() serialises straight to bytes; no intermediate as_string() copy
+        smtp.send_message(msg, send_from, send_to)
 
 
 # ----------------------------
 # Main loop
 # ----------------------------
 
-def do_one_round():
-    now = pytz.utc.localize(datetime.utcnow())
-    start = get_start(FEED_FILE)
-
-    # Pull posts (still used for the Articles section)
-    feeds = load_feeds()
-    posts = get_posts_list(feeds, start) if feeds else []
-    posts.sort()
-
-    # Build ChatGPT summary (weather + agenda + top UK headlines)
-    weather_data = fetch_cardiff_weather_data()
-    events = fetch_todays_events_struct()
-    summary_html = build_chatgpt_summary_html(weather_data, events)
-
-    # Build articles HTML from feeds (optional; skip if no posts)
-    if posts:
-        articles_html = "\n".join(
-            [HTML_PER_POST.format(**nicepost(p, i)) for i, p in enumerate(posts, start=1)]
-        )
-        body_html = (
-            HTML_HEAD
-            + summary_html
-            + "\n<h1>Articles</h1>\n"
-            + articles_html
-            + HTML_TAIL
-        )
-    else:
-        body_html = HTML_HEAD + summary_html + HTML_TAIL
+def load_last_sent():
+    try:
+        with open(LAST_SENT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    # Create EPUB
-    stamp = datetime.now(LONDON_TZ).strftime("%Y-%m-%d")
-    out_name = f"{DOC_TITLE.lower().replace(' ', '')}-{stamp}.epub"
-    raw_epub = Path(out_name)
-    final_epub = build_epub_kindlesafe(body_html, raw_epub)
 
+def save_last_sent(record):
+    try:
+        with open(LAST_SENT_FILE, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+    except OSError:
+        pass
+
+
+def document_chunks(summary_html, articles):
+    """Yield the HTML document piece by piece: head, summary, rendered articles, tail."""
+    yield HTML_HEAD
+    yield summary_html
+    # Articles section from feeds (optional; skip if no posts)
+    if articles:
+        yield "\n<h1>Articles</h1>\n"
+        yield from articles
+    yield HTML_TAIL
+
+
+def write_document(chunks, f=None):
+    """Write chunks to text file f, if given; returns the document's SHA-1 hex digest."""
+    h = hashlib.sha1()
+    for chunk in chunks:
+        if f is not None:
+            f.write(chunk)
+        h.update(chunk.encode("utf-8"))
+    return h.hexdigest()
+
+
+def send_epub(final_epub, stamp, digest):
     size = final_epub.stat().st_size
     if not size:
         logging.error("EPUB is empty; aborting send")
@@ -506,21 +686,100 @@ def do_one_round():
             files=[str(final_epub)],
         )
         logging.info("Sent to Kindle")
+        save_last_sent({"date": stamp, "hash": digest})
 
-    # Cleanup
-    for p in {raw_epub, final_epub}:
-        try:
-            p.unlink(missing_ok=True)
-        except Exception:
-            pass
+
+def do_one_round():
+    now = datetime.now(UTC)
+    start = get_start(FEED_FILE)
+
+    # Feeds, weather and calendars are independent downloads; run them side by side
+    feeds = load_feeds()
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        posts_job = ex.submit(get_posts_list, feeds, start)
+        weather_job = ex.submit(fetch_cardiff_weather_data)
+        events_job = ex.submit(fetch_todays_events_struct)
+        # Pull posts (still used for the Articles section)
+        posts = posts_job.result()
+        weather_data = weather_job.result()
+        events = events_job.result()
+    posts.sort()
+
+    # Build ChatGPT summary (weather + agenda + top UK headlines)
+    summary_html = build_chatgpt_summary_html(weather_data, events)
+
+    use_calibre = USE_CALIBRE and which("ebook-convert")
+    html_path = None
+    if use_calibre:
+        # Calibre reads a file: stream the document to disk one post at a time
+        articles = (render_post(p, i) for i, p in enumerate(posts, start=1))
+        with tempfile.NamedTemporaryFile("w", suffix=".html", delete=False, encoding="utf-8") as tmp_html:
+            digest = write_document(document_chunks(summary_html, articles), tmp_html)
+        html_path = Path(tmp_html.name)
+    else:
+        # ebooklib holds every chapter in memory anyway; render once, hash, build from the same strings
+        articles = [render_post(p, i) for i, p in enumerate(posts, start=1)]
+        digest = write_document(document_chunks(summary_html, articles))
+
+    stamp = datetime.now(LONDON_TZ).strftime("%Y-%m-%d")
+    out_name = f"{DOC_TITLE.lower().replace(' ', '')}-{stamp}.epub"
+    raw_epub = Path(out_name)
+    try:
+        # Skip EPUB build and send if today's digest is identical to the last one sent
+        if load_last_sent() == {"date": stamp, "hash": digest}:
+            logging.info("Content unchanged since last send; skipping")
+        else:
+            # Create EPUB
+            if use_calibre:
+                build_epub_calibre(html_path, raw_epub)
+            else:
+                build_epub_kindlesafe(summary_html, posts, articles, raw_epub)
+            send_epub(raw_epub, stamp, digest)
+    finally:
+        # Cleanup
+        for p in (html_path, raw_epub):
+            if p is None:
+                continue
+            try:
+                p.unlink(missing_ok=True)
+            except Exception:
+                pass
 
     # Mark timestamp
     update_start(now)
 
 
+def main():
+    """
+    Run do_one_round() every PERIOD minutes of wall clock, not PERIOD
+    minutes after the previous round finished. A round that overruns
+    its slot by more than MISFIRE_GRACE seconds coalesces the missed
+    runs into the next slot, so slow rounds never pile up.
+
+    A failing round is logged and the schedule carries on. SIGTERM or
+    SIGINT ends the wait between rounds immediately, so the container
+    stops promptly.
+    """
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    # Note: PERIOD was previously hours; here it's minutes for faster iteration.
+    # If you want hours, change to: interval = PERIOD * 60 * 60
+    interval = PERIOD * 60
+    next_run = time.monotonic()
+    while not stop.is_set():
+        try:
+            do_one_round()
+        except Exception:
+            logging.exception("Round failed")
+        next_run += interval
+        lag = time.monotonic() - next_run
+        if lag > MISFIRE_GRACE:
+            next_run += (lag // interval + 1) * interval
+        stop.wait(max(0.0, next_run - time.monotonic()))
+    logging.info("Shutting down")
+
+
 if __name__ == "__main__":
-    while True:
-        do_one_round()
-        # Note: PERIOD was previously hours; here it's minutes for faster iteration.
-        # If you want hours, change to: time.sleep(PERIOD * 60 * 60)
-        time.sleep(PERIOD * 60)
+    main()